@@ -0,0 +1,167 @@
+################################################################################
+#
+# Exact amortization ledgers kept in integer cents. Interest and payments are
+# rounded to the cent each month the way loan servicers do, and schedules are
+# stored as int64 NumPy arrays with one row per loan and one column per month.
+# Public functions:
+#  * to_cents(dollars)
+#  * to_dollars(cents)
+#  * scale_rates(annual_interest_rates)
+#  * calculate_monthly_interest_in_cents(balances, scaled_rates)
+#  * calculate_monthly_payments_in_cents(principals, annual_interest_rates,
+#                                        mortgage_terms_years)
+#  * calculate_schedules_in_cents(principals, annual_interest_rates,
+#                                 mortgage_terms_years,
+#                                 additional_monthly_payments, n_months)
+#
+################################################################################
+
+import numpy as np
+
+# Annual interest rates are stored as integer multiples of 1e-8 (i.e. 1e-6 of a
+# percent), so that monthly interest can be computed with integer arithmetic.
+RATE_SCALE = 100000000
+
+# The largest balance times scaled rate that _round_divide can take without
+# overflowing int64.
+MAX_INTEREST_NUMERATOR = (np.iinfo(np.int64).max - 12 * RATE_SCALE) // 2
+
+def to_cents(dollars):
+    """
+    Converts dollar amounts to integer cents, rounding to the nearest cent.
+    Args:
+      * dollars: a dollar amount or array of dollar amounts.
+    Returns:
+      * the amounts in cents as int64.
+    """
+    return np.rint(np.asarray(dollars, dtype=np.float64) * 100.0).astype(
+        np.int64)
+
+def to_dollars(cents):
+    """
+    Converts integer cents to dollar amounts.
+    Args:
+      * cents: an amount or array of amounts in cents.
+    Returns:
+      * the amounts in dollars as float64.
+    """
+    return np.asarray(cents, dtype=np.int64) / 100.0
+
+def scale_rates(annual_interest_rates):
+    """
+    Converts annual interest rates to integers in units of 1 / RATE_SCALE.
+    Args:
+      * annual_interest_rates: the annual interest rates as fractions.
+    Returns:
+      * the scaled annual interest rates as int64.
+    """
+    return np.rint(np.asarray(annual_interest_rates, dtype=np.float64) *
+                   RATE_SCALE).astype(np.int64)
+
+def _round_divide(numerators, denominator):
+    """
+    Divides non-negative integers, rounding halves up.
+    Args:
+      * numerators: the int64 numerators.
+      * denominator: the positive integer denominator.
+    Returns:
+      * the rounded quotients as int64.
+    """
+    return (2 * numerators + denominator) // (2 * denominator)
+
+def calculate_monthly_interest_in_cents(balances, scaled_rates):
+    """
+    Calculates one month of interest on balances, rounded to the cent.
+    Args:
+      * balances: the outstanding balances in cents.
+      * scaled_rates: the annual interest rates, as returned by scale_rates.
+    Returns:
+      * the interest accrued over the month in cents as int64.
+    """
+    balances = np.asarray(balances, dtype=np.int64)
+    scaled_rates = np.asarray(scaled_rates, dtype=np.int64)
+    if np.any(np.abs(balances) > MAX_INTEREST_NUMERATOR //
+              np.maximum(np.abs(scaled_rates), 1)):
+        raise ValueError('Balance too large for exact interest in int64 cents')
+    return _round_divide(balances * scaled_rates, 12 * RATE_SCALE)
+
+def calculate_monthly_payments_in_cents(principals, annual_interest_rates,
+                                        mortgage_terms_years):
+    """
+    Calculates the minimum monthly payment of each loan, rounded to the cent.
+    Interest compounds monthly at one twelfth of the annual rate.
+    Args:
+      * principals: the principal amount of each loan in dollars.
+      * annual_interest_rates: the annual interest rate of each loan.
+      * mortgage_terms_years: the number of years until each loan is paid.
+    Returns:
+      * the minimum monthly payment of each loan in cents as int64.
+    """
+    principals = np.asarray(principals, dtype=np.float64)
+    monthly_rates = np.asarray(annual_interest_rates, dtype=np.float64) / 12.0
+    n_months = 12.0 * np.asarray(mortgage_terms_years, dtype=np.float64)
+    growth = (1.0 + monthly_rates)**n_months
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payments = np.where(
+            monthly_rates > 0,
+            principals * growth * monthly_rates / (growth - 1.0),
+            principals / n_months)
+    return to_cents(payments)
+
+def calculate_schedules_in_cents(principals, annual_interest_rates,
+                                 mortgage_terms_years,
+                                 additional_monthly_payments = 0.0,
+                                 n_months = None):
+    """
+    Calculates exact monthly amortization schedules for a set of loans. Each
+    month the interest on the outstanding balance is rounded to the cent, and
+    the final payment is adjusted so that the balance ends at exactly zero. The
+    loop runs over months only; all loans are updated together with int64
+    array arithmetic.
+    Args:
+      * principals: the principal amount of each loan in dollars.
+      * annual_interest_rates: the annual interest rate of each loan.
+      * mortgage_terms_years: the number of years until each loan is paid.
+      * additional_monthly_payments: the amount paid each month beyond the
+        minimum required by each mortgage, in dollars.
+      * n_months: the number of months to schedule. Defaults to the longest
+        mortgage term.
+    Returns:
+      * a dictionary of int64 arrays of shape (loans, months), in cents:
+        'debts' is the balance at the start of each month, 'payments',
+        'interest' and 'principal' are the amounts paid during each month.
+      * the number of months until each loan is paid off.
+    """
+    principals, annual_interest_rates, mortgage_terms_years = (
+        np.broadcast_arrays(np.atleast_1d(principals),
+                            np.atleast_1d(annual_interest_rates),
+                            np.atleast_1d(mortgage_terms_years)))
+    n_loans = principals.shape[0]
+    if n_months is None:
+        n_months = int(12 * np.max(mortgage_terms_years))
+    scheduled_payments = (
+        calculate_monthly_payments_in_cents(
+            principals, annual_interest_rates, mortgage_terms_years) +
+        np.broadcast_to(to_cents(additional_monthly_payments), (n_loans,)))
+    scaled_rates = scale_rates(annual_interest_rates)
+    final_months = (12 * mortgage_terms_years).astype(np.int64) - 1
+
+    schedules = {
+        key: np.zeros((n_loans, n_months), dtype=np.int64)
+        for key in ['debts', 'payments', 'interest', 'principal']
+    }
+    balances = to_cents(principals)
+    months_until_paid_off = np.where(balances > 0, n_months, 0)
+    for month in range(n_months):
+        schedules['debts'][:, month] = balances
+        interest = calculate_monthly_interest_in_cents(balances, scaled_rates)
+        payments = np.where(
+            month >= final_months, balances + interest,
+            np.minimum(scheduled_payments, balances + interest))
+        schedules['interest'][:, month] = interest
+        schedules['payments'][:, month] = payments
+        schedules['principal'][:, month] = payments - interest
+        balances = balances + interest - payments
+        paid_off = (balances == 0) & (months_until_paid_off == n_months)
+        months_until_paid_off[paid_off] = month + 1
+    return schedules, months_until_paid_off
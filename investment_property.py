@@ -8,14 +8,17 @@
 #  * calculate_equity_at_year(year, additional_annual_payment)
 #  * calculate_equity_at_month(month, additional_monthly_payment)
 #  * calculate_all(additional_monthly_payment)
+#  * calculate_all_in_cents(additional_monthly_payment)
 #  * plot_gains(additional_monthly_payment)
 #  * plot_equity_and_debt(additional_monthly_payment)
 #
 ################################################################################
 
 import balance_sheet as bs
+import cents_ledger as cl
 import matplotlib.pyplot as plt
 import mortgage as mort
+import numpy as np
 import scipy as scipy
 
 class investment_property:
@@ -132,6 +135,35 @@ class investment_property:
             if debt > 0: months_until_paid_off = month
         return results, (months_until_paid_off / 12.0)
 
+    def calculate_all_in_cents(self, additional_monthly_payment):
+        """
+        Calculates the equity, debt, value, and payment from the exact mortgage
+        ledger, with payments and interest rounded to the cent each month. Note
+        that the ledger compounds interest monthly at one twelfth of the annual
+        rate, while calculate_all compounds annually, so the payments differ.
+        Args:
+          * additional_monthly_payment: extra monthly payment beyond minimum.
+        Returns:
+          * int64 arrays of the months and of the amount of debt, equity,
+            property value, payment size, and interest, in cents.
+          * the number of years until the property is paid off, counted to the
+            last month with debt as in calculate_all.
+        """
+        schedule, months_until_paid_off = (
+            self.mortgage_.calculate_schedule_in_cents(
+                additional_monthly_payment))
+        months = np.arange(len(schedule['debts']), dtype=np.int64)
+        values = cl.to_cents(self.get_property_value_at_month(months))
+        results = {
+            'months': months,
+            'debts': schedule['debts'],
+            'equities': values - schedule['debts'],
+            'payments': schedule['payments'],
+            'interest': schedule['interest'],
+            'values': values
+        }
+        return results, (max(months_until_paid_off - 1, 0) / 12.0)
+
     def plot_equity_and_debt(self, additional_monthly_payment):
         """
         Plots and calculates the equity, debt, value, and payment.
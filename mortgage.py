@@ -9,10 +9,13 @@
 #  * calculate_debt_at_month(month, additional_monthly_payment)
 #  * calculate_years_until_paid_off(additional_annual_payment)
 #  * calculate_months_until_paid_off(additional_monthly_payment)
+#  * get_monthly_payment_in_cents()
+#  * calculate_schedule_in_cents(additional_monthly_payment)
 #  * print_mortgage(additional_monthly_payment)
 #
 ################################################################################
 
+import cents_ledger as cl
 import matplotlib.pyplot as plt
 import scipy as scipy
 
@@ -110,6 +113,37 @@ class mortgage:
                 return month
         return (self.mortgage_term_years_ * 12.0)
 
+    def get_monthly_payment_in_cents(self):
+        """
+        Calculates the minimum monthly payment with monthly compounding, rounded
+        to the cent as a loan servicer would bill it. Interest accrues each
+        month at one twelfth of the annual rate, unlike get_monthly_payment,
+        which is one twelfth of the annually compounded annual payment.
+        Returns:
+          * the minimum monthly payment in cents.
+        """
+        return int(cl.calculate_monthly_payments_in_cents(
+            self.principal_loan_amount_, self.annual_interest_rate_,
+            self.mortgage_term_years_))
+
+    def calculate_schedule_in_cents(self, additional_monthly_payment = 0.0):
+        """
+        Calculates the exact amortization schedule, with interest compounded
+        monthly and payments and interest rounded to the cent each month.
+        Args:
+          * additional_monthly_payment: the amount paid each month beyond the
+            minimum required by the mortgage.
+        Returns:
+          * a dictionary of int64 arrays of 'debts', 'payments', 'interest' and
+            'principal' by month, in cents.
+          * the number of months until the mortgage is paid.
+        """
+        schedules, months_until_paid_off = cl.calculate_schedules_in_cents(
+            self.principal_loan_amount_, self.annual_interest_rate_,
+            self.mortgage_term_years_, additional_monthly_payment)
+        return ({key: schedules[key][0] for key in schedules},
+                int(months_until_paid_off[0]))
+
     def print_mortgage(self, additional_monthly_payment = 0.0):
         """
         Prints the mortgage parameters.
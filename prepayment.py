@@ -0,0 +1,257 @@
+################################################################################
+#
+# The prepayment_optimizer class allocates a monthly budget of extra cash across
+# several mortgages. Each strategy is a priority order of the loans: every
+# month the budget goes to the first loan in the order that still has debt, and
+# any excess spills over to the next. As loans are paid off their minimum
+# payments roll into the budget. All loans, and all candidate orders, are
+# simulated together in integer cents with the cents_ledger conventions.
+# Public methods:
+#  * init(mortgages, monthly_budget, horizon_months, properties,
+#         roll_over_payments)
+#  * get_avalanche_order()
+#  * get_snowball_order()
+#  * simulate(priority_orders, record_extra_payments)
+#  * optimize_order(objective, max_iterations)
+#  * compare_strategies(objective)
+#  * print_comparison(objective)
+#
+################################################################################
+
+import cents_ledger as cl
+import itertools
+import numpy as np
+
+# Orders over at most this many loans are optimized by trying every order.
+MAX_LOANS_FOR_EXHAUSTIVE_SEARCH = 7
+
+# The number of candidate orders simulated together in one batch.
+BATCH_SIZE = 4096
+
+OBJECTIVES = ['interest', 'equity']
+
+class prepayment_optimizer:
+    """
+    A class for allocating extra monthly payments across a set of mortgages.
+    """
+    def __init__(self, mortgages, monthly_budget, horizon_months = None,
+                 properties = None, roll_over_payments = True):
+        """
+        Initializes the prepayment optimizer class.
+        Args:
+          * mortgages: the list of mortgages sharing the budget.
+          * monthly_budget: the extra cash available each month, in dollars.
+          * horizon_months: the number of months simulated. Defaults to the
+            longest mortgage term.
+          * properties: an optional list of investment properties, one per
+            mortgage, whose values are counted in the equity at the horizon.
+          * roll_over_payments: whether the minimum payments of loans that have
+            been paid off are added to the budget.
+        """
+        if len(mortgages) == 0:
+            raise ValueError('At least one mortgage is required')
+        if properties is not None and len(properties) != len(mortgages):
+            raise ValueError('Expected one property per mortgage, got %d for %d'
+                             % (len(properties), len(mortgages)))
+        self.mortgages_ = mortgages
+        self.monthly_budget_ = monthly_budget
+        self.roll_over_payments_ = roll_over_payments
+        self.principals_ = cl.to_cents(
+            [m.principal_loan_amount_ for m in mortgages])
+        self.annual_interest_rates_ = np.array(
+            [m.annual_interest_rate_ for m in mortgages], dtype=np.float64)
+        self.scaled_rates_ = cl.scale_rates(self.annual_interest_rates_)
+        terms_years = np.array(
+            [m.mortgage_term_years_ for m in mortgages], dtype=np.float64)
+        self.final_months_ = (12 * terms_years).astype(np.int64) - 1
+        self.minimum_payments_ = cl.calculate_monthly_payments_in_cents(
+            [m.principal_loan_amount_ for m in mortgages],
+            self.annual_interest_rates_, terms_years)
+        if horizon_months is None:
+            horizon_months = int(12 * np.max(terms_years))
+        self.horizon_months_ = horizon_months
+        self.value_at_horizon_ = 0
+        if properties is not None:
+            self.value_at_horizon_ = int(np.sum(cl.to_cents(
+                [p.get_property_value_at_month(horizon_months)
+                 for p in properties])))
+
+    def get_avalanche_order(self):
+        """
+        Orders the loans by decreasing interest rate, breaking ties by the
+        smaller balance.
+        Returns:
+          * the indices of the loans, highest priority first.
+        """
+        return np.lexsort((self.principals_, -self.annual_interest_rates_))
+
+    def get_snowball_order(self):
+        """
+        Orders the loans by increasing balance, breaking ties by the higher
+        interest rate.
+        Returns:
+          * the indices of the loans, highest priority first.
+        """
+        return np.lexsort((-self.annual_interest_rates_, self.principals_))
+
+    def simulate(self, priority_orders, record_extra_payments = False):
+        """
+        Simulates every loan month by month for a batch of priority orders.
+        Args:
+          * priority_orders: an array of shape (candidates, loans), or a single
+            order of shape (loans,), of loan indices, highest priority first.
+          * record_extra_payments: whether to return the extra payment made to
+            each loan in each month.
+        Returns:
+          * a dictionary of int64 arrays in cents, one entry per candidate:
+            'total_interest' paid over the horizon, 'debts_at_horizon' and
+            'equities_at_horizon', plus 'months_until_paid_off' per loan and,
+            if requested, 'extra_payments' of shape (candidates, months, loans).
+        """
+        priority_orders = np.atleast_2d(priority_orders)
+        n_candidates, n_loans = priority_orders.shape
+        balances = np.tile(self.principals_, (n_candidates, 1))
+        budget = cl.to_cents(self.monthly_budget_)
+        total_interest = np.zeros(n_candidates, dtype=np.int64)
+        months_until_paid_off = np.where(
+            balances > 0, self.horizon_months_, 0)
+        if record_extra_payments:
+            extra_payments = np.zeros(
+                (n_candidates, self.horizon_months_, n_loans), dtype=np.int64)
+        for month in range(self.horizon_months_):
+            interest = cl.calculate_monthly_interest_in_cents(
+                balances, self.scaled_rates_)
+            owed = balances + interest
+            minimums = np.where(month >= self.final_months_, owed,
+                                np.minimum(self.minimum_payments_, owed))
+            remaining = owed - minimums
+            pool = np.full(n_candidates, budget, dtype=np.int64)
+            if self.roll_over_payments_:
+                pool += np.sum(
+                    np.maximum(self.minimum_payments_ - minimums, 0), axis=1)
+            # Fill the loans in priority order until the pool runs out.
+            ordered_remaining = np.take_along_axis(
+                remaining, priority_orders, axis=1)
+            owed_before = (np.cumsum(ordered_remaining, axis=1) -
+                           ordered_remaining)
+            ordered_extra = np.clip(
+                pool[:, None] - owed_before, 0, ordered_remaining)
+            extra = np.zeros_like(remaining)
+            np.put_along_axis(extra, priority_orders, ordered_extra, axis=1)
+            if record_extra_payments:
+                extra_payments[:, month, :] = extra
+            balances = remaining - extra
+            total_interest += np.sum(interest, axis=1)
+            paid_off = ((balances == 0) &
+                        (months_until_paid_off == self.horizon_months_))
+            months_until_paid_off[paid_off] = month + 1
+        debts_at_horizon = np.sum(balances, axis=1)
+        results = {
+            'total_interest': total_interest,
+            'debts_at_horizon': debts_at_horizon,
+            'equities_at_horizon': self.value_at_horizon_ - debts_at_horizon,
+            'months_until_paid_off': months_until_paid_off,
+        }
+        if record_extra_payments:
+            results['extra_payments'] = extra_payments
+        return results
+
+    def _score(self, priority_orders, objective):
+        """
+        Scores a batch of priority orders, where lower scores are better.
+        Args:
+          * priority_orders: an array of shape (candidates, loans).
+          * objective: 'interest' or 'equity'.
+        Returns:
+          * the score of each candidate.
+        """
+        scores = []
+        for start in range(0, len(priority_orders), BATCH_SIZE):
+            results = self.simulate(priority_orders[start:start + BATCH_SIZE])
+            if objective == 'interest':
+                scores.append(results['total_interest'])
+            else:
+                scores.append(-results['equities_at_horizon'])
+        return np.concatenate(scores)
+
+    def optimize_order(self, objective = 'interest', max_iterations = 100):
+        """
+        Finds the priority order that minimizes the total interest paid, or
+        maximizes the equity, at the horizon. Small sets of loans are searched
+        exhaustively. Larger sets start from the better of the avalanche and
+        snowball orders and repeatedly apply the best swap of two loans, with
+        all swaps of an iteration simulated together.
+        Args:
+          * objective: 'interest' or 'equity'.
+          * max_iterations: the maximum number of swaps applied.
+        Returns:
+          * the best order found.
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError('Unknown objective: %s' % objective)
+        n_loans = len(self.mortgages_)
+        # The standard orders come first, so that they are kept on ties.
+        candidates = np.array([self.get_avalanche_order(),
+                               self.get_snowball_order()])
+        if n_loans <= MAX_LOANS_FOR_EXHAUSTIVE_SEARCH:
+            candidates = np.vstack([candidates, np.array(
+                list(itertools.permutations(range(n_loans))),
+                dtype=np.int64).reshape(-1, n_loans)])
+            return candidates[np.argmin(self._score(candidates, objective))]
+
+        scores = self._score(candidates, objective)
+        best_order = candidates[np.argmin(scores)]
+        best_score = np.min(scores)
+        first, second = np.triu_indices(n_loans, k=1)
+        swaps = np.arange(len(first))
+        for _ in range(max_iterations):
+            candidates = np.tile(best_order, (len(first), 1))
+            candidates[swaps, first] = best_order[second]
+            candidates[swaps, second] = best_order[first]
+            scores = self._score(candidates, objective)
+            if np.min(scores) >= best_score:
+                break
+            best_order = candidates[np.argmin(scores)]
+            best_score = np.min(scores)
+        return best_order
+
+    def compare_strategies(self, objective = 'interest'):
+        """
+        Simulates the avalanche, snowball and optimized orders.
+        Args:
+          * objective: the objective of the optimized order.
+        Returns:
+          * a dictionary from strategy name to its order and the results of
+            simulate for that order, with the leading candidate axis removed.
+        """
+        orders = {
+            'Avalanche': self.get_avalanche_order(),
+            'Snowball': self.get_snowball_order(),
+            'Optimized': self.optimize_order(objective),
+        }
+        comparison = {}
+        for name in orders:
+            results = self.simulate(orders[name], record_extra_payments=True)
+            comparison[name] = (
+                orders[name], {key: results[key][0] for key in results})
+        return comparison
+
+    def print_comparison(self, objective = 'interest'):
+        """
+        Prints the interest, debt and equity at the horizon for each strategy.
+        Args:
+          * objective: the objective of the optimized order.
+        """
+        comparison = self.compare_strategies(objective)
+        print('Horizon: %d months, monthly budget: $%2.2f' %
+              (self.horizon_months_, self.monthly_budget_))
+        for name in comparison:
+            order, results = comparison[name]
+            print('\n----- %s -----' % name)
+            print('\tOrder of loans = %s' % order.tolist())
+            print('\tTotal interest = $%2.2f' %
+                  cl.to_dollars(results['total_interest']))
+            print('\tDebt at horizon = $%2.2f' %
+                  cl.to_dollars(results['debts_at_horizon']))
+            print('\tEquity at horizon = $%2.2f' %
+                  cl.to_dollars(results['equities_at_horizon']))
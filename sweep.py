@@ -0,0 +1,450 @@
+################################################################################
+#
+# Sharded parameter sweeps over mortgage, balance sheet and property inputs,
+# coordinated through a work queue on a shared filesystem. The scenario space is
+# the cartesian product of the swept parameter values, split into contiguous
+# shards of scenario indices. Workers on any machine that sees the directory
+# claim shards by atomically renaming them, write one columnar .npz file per
+# shard, and skip shards that already have outputs, so a crashed sweep can be
+# resumed by simply starting the workers again. Once the pending queue is empty,
+# workers wait for the remaining claims and take over any that go stale, so
+# shards held by crashed workers are finished without manual requeueing.
+#
+# Directory layout:
+#  * sweep.json: the swept parameters, shard size and horizon.
+#  * pending/, running/, done/: one shard file per shard, by state.
+#  * outputs/: one .npz of result columns per finished shard.
+#
+# Public functions:
+#  * create_sweep(directory, parameters, shard_size, horizon_years)
+#  * run_worker(directory, worker_id, evaluate, stale_timeout_seconds)
+#  * requeue_stale_shards(directory, timeout_seconds)
+#  * get_sweep_status(directory)
+#  * merge_outputs(directory, output_path)
+#  * evaluate_scenarios(columns, horizon_years)
+#
+# The queue can also be driven from the shell with:
+#   python sweep.py worker <directory> [worker_id]
+#   python sweep.py requeue <directory> <timeout_seconds>
+#   python sweep.py status <directory>
+#   python sweep.py merge <directory> <output_path>
+#
+################################################################################
+
+import argparse
+import cents_ledger as cl
+import json
+import numpy as np
+import os
+import socket
+import sys
+import threading
+import time
+
+# Default values of every input that can be swept.
+DEFAULT_PARAMETERS = {
+    'principal_loan_amount': 200000.0,
+    'loan_down_payment': 40000.0,
+    'annual_interest_rate': 0.045,
+    'mortgage_term_years': 30,
+    'additional_monthly_payment': 0.0,
+    'initial_property_value': 240000.0,
+    'annual_appreciation_rate': 0.03,
+    'monthly_income': 0.0,
+    'monthly_expenses': 0.0,
+}
+
+QUEUE_STATES = ['pending', 'running', 'done']
+
+# How often, in seconds, a worker refreshes the modification time of the claim
+# it is running, so that live claims are never considered stale.
+HEARTBEAT_SECONDS = 10
+
+# How long, in seconds, a claim may go without a refresh before idle workers
+# take it over.
+STALE_TIMEOUT_SECONDS = 6 * HEARTBEAT_SECONDS
+
+def _shard_name(shard):
+    return 'shard_%06d' % shard
+
+def _claim_suffix(worker_id):
+    return '.' + worker_id
+
+def _claim_owner(name):
+    """
+    Parses the worker id from the name of a claim in running/.
+    Args:
+      * name: the file name of the claim, e.g. 'shard_000001.node.a'.
+    Returns:
+      * the worker id, or None if the name has none.
+    """
+    parts = name.split('.', 1)
+    return parts[1] if len(parts) == 2 else None
+
+def _write_atomically(path, write):
+    """
+    Writes a file under a temporary name and renames it into place, so that
+    readers on other machines never see a partial file.
+    Args:
+      * path: the final path of the file.
+      * write: a function taking an open binary file and writing its contents.
+    """
+    temporary_path = '%s.tmp.%s.%d' % (path, socket.gethostname(), os.getpid())
+    with open(temporary_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+def _load_config(directory):
+    with open(os.path.join(directory, 'sweep.json')) as f:
+        return json.load(f)
+
+def create_sweep(directory, parameters, shard_size = 1000,
+                 horizon_years = 10):
+    """
+    Creates the work queue for a sweep over the cartesian product of the given
+    parameter values. Inputs that are not swept take their default values.
+    Args:
+      * directory: the shared directory holding the queue and outputs.
+      * parameters: a dictionary from input name to the list of values swept.
+      * shard_size: the number of scenarios in each shard.
+      * horizon_years: the number of years after which equity is evaluated.
+    Returns:
+      * the number of shards created.
+    """
+    if not parameters:
+        raise ValueError('At least one parameter must be swept')
+    for name in parameters:
+        if name not in DEFAULT_PARAMETERS:
+            raise ValueError('Unknown sweep parameter: %s' % name)
+    if shard_size <= 0:
+        raise ValueError('Shard size must be positive: %s' % shard_size)
+    if os.path.exists(os.path.join(directory, 'sweep.json')):
+        raise ValueError('A sweep already exists in %s' % directory)
+    for state in QUEUE_STATES + ['outputs']:
+        os.makedirs(os.path.join(directory, state), exist_ok=True)
+    config = {
+        'parameters': {name: np.asarray(parameters[name]).tolist()
+                       for name in parameters},
+        'shard_size': int(shard_size),
+        'horizon_years': horizon_years,
+    }
+    n_scenarios = int(np.prod([len(v) for v in parameters.values()]))
+    n_shards = (n_scenarios + shard_size - 1) // shard_size
+    for shard in range(n_shards):
+        start = shard * shard_size
+        shard_description = json.dumps({
+            'shard': shard, 'start': start,
+            'stop': min(start + shard_size, n_scenarios)}).encode()
+        _write_atomically(
+            os.path.join(directory, 'pending', _shard_name(shard)),
+            lambda f: f.write(shard_description))
+    # The config is written last: workers ignore a directory without it.
+    config['n_scenarios'] = n_scenarios
+    config['n_shards'] = n_shards
+    _write_atomically(os.path.join(directory, 'sweep.json'),
+                      lambda f: f.write(json.dumps(config, indent=2).encode()))
+    return n_shards
+
+def get_scenario_columns(config, start, stop):
+    """
+    Builds the input columns for a contiguous range of scenarios.
+    Args:
+      * config: the sweep configuration.
+      * start: the index of the first scenario.
+      * stop: one past the index of the last scenario.
+    Returns:
+      * a dictionary from input name to an array of values, one per scenario.
+    """
+    swept = config['parameters']
+    names = list(swept)
+    indices = np.unravel_index(np.arange(start, stop),
+                               [len(swept[name]) for name in names])
+    columns = {}
+    for name in DEFAULT_PARAMETERS:
+        if name in swept:
+            values = np.asarray(swept[name])
+            columns[name] = values[indices[names.index(name)]]
+        else:
+            columns[name] = np.full(stop - start, DEFAULT_PARAMETERS[name])
+    return columns
+
+def evaluate_scenarios(columns, horizon_years = 10):
+    """
+    Evaluates a batch of scenarios with the exact cents ledger. The annual
+    return on the cash invested is NaN for scenarios without a down payment.
+    Args:
+      * columns: a dictionary from input name to an array of values.
+      * horizon_years: the number of years after which equity is evaluated.
+    Returns:
+      * a dictionary from result name to an array of values, one per scenario.
+    """
+    schedules, months_until_paid_off = cl.calculate_schedules_in_cents(
+        columns['principal_loan_amount'], columns['annual_interest_rate'],
+        columns['mortgage_term_years'],
+        columns['additional_monthly_payment'])
+    horizon_months = int(12 * horizon_years)
+    n_months = schedules['debts'].shape[1]
+    if horizon_months < n_months:
+        debt_at_horizon = schedules['debts'][:, horizon_months]
+    else:
+        debt_at_horizon = np.zeros(len(months_until_paid_off), dtype=np.int64)
+    value_at_horizon = cl.to_cents(
+        columns['initial_property_value'] *
+        (1.0 + columns['annual_appreciation_rate'])**horizon_years)
+    monthly_payment = cl.calculate_monthly_payments_in_cents(
+        columns['principal_loan_amount'], columns['annual_interest_rate'],
+        columns['mortgage_term_years'])
+    monthly_cash_flow = (
+        cl.to_cents(columns['monthly_income']) -
+        cl.to_cents(columns['monthly_expenses']) - monthly_payment)
+    # Cash on cash return, as in balance_sheet.print_statement, with the down
+    # payment as the cash invested.
+    cash_invested = cl.to_cents(columns['loan_down_payment'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annual_roi = np.where(cash_invested > 0,
+                              12.0 * monthly_cash_flow / cash_invested, np.nan)
+    results = dict(columns)
+    results.update({
+        'monthly_payment': cl.to_dollars(monthly_payment),
+        'months_until_paid_off': months_until_paid_off,
+        'total_interest': cl.to_dollars(schedules['interest'].sum(axis=1)),
+        'equity_at_horizon': cl.to_dollars(value_at_horizon - debt_at_horizon),
+        'monthly_cash_flow': cl.to_dollars(monthly_cash_flow),
+        'annual_roi': annual_roi,
+    })
+    return results
+
+def _claim_next_shard(directory, worker_id):
+    """
+    Claims a pending shard by renaming it into running/. Renames are atomic on
+    the shared filesystem, so exactly one worker wins each shard.
+    Args:
+      * directory: the sweep directory.
+      * worker_id: the identifier of the claiming worker.
+    Returns:
+      * the path of the claimed shard in running/, or None if none are left.
+    """
+    pending = os.path.join(directory, 'pending')
+    for name in sorted(os.listdir(pending)):
+        if '.tmp.' in name: continue
+        claimed_path = os.path.join(directory, 'running',
+                                    name + _claim_suffix(worker_id))
+        try:
+            os.rename(os.path.join(pending, name), claimed_path)
+        except FileNotFoundError:
+            # Another worker claimed this shard first.
+            continue
+        # Renames keep the old modification time; reset it for staleness.
+        try:
+            os.utime(claimed_path)
+        except FileNotFoundError:
+            # The claim looked stale and was requeued before it was refreshed.
+            continue
+        return claimed_path
+    return None
+
+def _refresh_claim(claimed_path, stopped):
+    """
+    Refreshes the modification time of a claim every HEARTBEAT_SECONDS until
+    stopped, or until the claim has been moved away.
+    Args:
+      * claimed_path: the path of the claimed shard in running/.
+      * stopped: a threading.Event set when the shard has finished.
+    """
+    while not stopped.wait(HEARTBEAT_SECONDS):
+        try:
+            os.utime(claimed_path)
+        except FileNotFoundError:
+            return
+
+def _run_shard(directory, config, claimed_path, evaluate):
+    """
+    Evaluates a claimed shard, writes its outputs and marks it done. Shards that
+    already have outputs are only marked done. The claim is kept fresh while
+    the shard runs.
+    Args:
+      * directory: the sweep directory.
+      * config: the sweep configuration.
+      * claimed_path: the path of the claimed shard in running/.
+      * evaluate: the function evaluating a dictionary of input columns.
+    Returns:
+      * whether the shard was run, i.e. the claim had not been lost.
+    """
+    try:
+        with open(claimed_path) as f:
+            description = json.load(f)
+    except FileNotFoundError:
+        # The claim was requeued as stale before it could be read.
+        return False
+    name = _shard_name(description['shard'])
+    output_path = os.path.join(directory, 'outputs', name + '.npz')
+    if not os.path.exists(output_path):
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=_refresh_claim,
+                                     args=(claimed_path, stopped), daemon=True)
+        heartbeat.start()
+        try:
+            columns = get_scenario_columns(
+                config, description['start'], description['stop'])
+            results = evaluate(columns, config['horizon_years'])
+            _write_atomically(output_path, lambda f: np.savez(f, **results))
+        finally:
+            stopped.set()
+            heartbeat.join()
+    try:
+        os.rename(claimed_path, os.path.join(directory, 'done', name))
+    except FileNotFoundError:
+        # The claim was requeued as stale; the output is already in place, so
+        # the next worker to claim it will only mark it done.
+        pass
+    return True
+
+def run_worker(directory, worker_id = None, evaluate = evaluate_scenarios,
+               stale_timeout_seconds = STALE_TIMEOUT_SECONDS):
+    """
+    Processes shards until every shard is done. A worker restarted with the
+    same worker_id first finishes the shards it held when it stopped. Once the
+    pending queue is empty, the worker waits for the claims of other workers
+    and requeues and runs any that go stale, such as those of a crashed worker.
+    Args:
+      * directory: the sweep directory.
+      * worker_id: an identifier for the worker. Defaults to the host name and
+        process id.
+      * evaluate: the function evaluating a dictionary of input columns and the
+        horizon in years.
+      * stale_timeout_seconds: the time without a refresh after which a claim
+        is taken over. If None, the worker returns as soon as the pending
+        queue is empty.
+    Returns:
+      * the number of shards processed by this worker.
+    """
+    if worker_id is None:
+        worker_id = '%s-%d' % (socket.gethostname(), os.getpid())
+    config = _load_config(directory)
+    running = os.path.join(directory, 'running')
+    n_processed = 0
+    for name in sorted(os.listdir(running)):
+        if _claim_owner(name) == worker_id:
+            if _run_shard(directory, config, os.path.join(running, name),
+                          evaluate):
+                n_processed += 1
+    while True:
+        claimed_path = _claim_next_shard(directory, worker_id)
+        if claimed_path is not None:
+            if _run_shard(directory, config, claimed_path, evaluate):
+                n_processed += 1
+            continue
+        if (stale_timeout_seconds is None or
+            get_sweep_status(directory)['running'] == 0):
+            return n_processed
+        if requeue_stale_shards(directory, stale_timeout_seconds) == 0:
+            time.sleep(HEARTBEAT_SECONDS)
+
+def requeue_stale_shards(directory, timeout_seconds):
+    """
+    Returns shards claimed longer ago than a timeout to the pending queue, e.g.
+    after a worker machine has crashed. Running workers refresh their claims
+    every HEARTBEAT_SECONDS, so the timeout should be several times longer;
+    a shorter timeout requeues live shards and duplicates their work.
+    Args:
+      * directory: the sweep directory.
+      * timeout_seconds: the time since the last refresh after which a claim is
+        considered stale.
+    Returns:
+      * the number of shards requeued.
+    """
+    running = os.path.join(directory, 'running')
+    now = time.time()
+    n_requeued = 0
+    for name in sorted(os.listdir(running)):
+        claimed_path = os.path.join(running, name)
+        try:
+            if now - os.path.getmtime(claimed_path) < timeout_seconds:
+                continue
+            os.rename(claimed_path, os.path.join(
+                directory, 'pending', name.split('.', 1)[0]))
+        except FileNotFoundError:
+            # The shard finished or was requeued in the meantime.
+            continue
+        n_requeued += 1
+    return n_requeued
+
+def get_sweep_status(directory):
+    """
+    Counts the shards in each state of the queue.
+    Args:
+      * directory: the sweep directory.
+    Returns:
+      * a dictionary from queue state to the number of shards.
+    """
+    return {state: len([name for name in
+                        os.listdir(os.path.join(directory, state))
+                        if '.tmp.' not in name])
+            for state in QUEUE_STATES}
+
+def merge_outputs(directory, output_path = None):
+    """
+    Concatenates the outputs of every shard, in scenario order.
+    Args:
+      * directory: the sweep directory.
+      * output_path: if given, the merged columns are also saved to this .npz.
+    Returns:
+      * a dictionary from column name to an array with one value per scenario.
+    """
+    config = _load_config(directory)
+    shard_results = []
+    for shard in range(config['n_shards']):
+        path = os.path.join(directory, 'outputs', _shard_name(shard) + '.npz')
+        if not os.path.exists(path):
+            raise ValueError('Shard %d of %d has not finished' %
+                             (shard, config['n_shards']))
+        with np.load(path) as shard_result:
+            shard_results.append(
+                {key: shard_result[key] for key in shard_result.files})
+    merged = {key: np.concatenate([r[key] for r in shard_results])
+              for key in shard_results[0]} if shard_results else {}
+    if output_path is not None:
+        _write_atomically(output_path, lambda f: np.savez(f, **merged))
+    return merged
+
+def main(arguments):
+    """
+    Runs a worker, requeues stale shards, prints the status or merges the
+    outputs of a sweep from the shell.
+    Args:
+      * arguments: the command line arguments, without the program name.
+    """
+    parser = argparse.ArgumentParser(prog='sweep.py')
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='process shards')
+    worker.add_argument('directory')
+    worker.add_argument('worker_id', nargs='?')
+    requeue = commands.add_parser('requeue', help='requeue stale shards')
+    requeue.add_argument('directory')
+    requeue.add_argument('timeout_seconds', type=float)
+    status = commands.add_parser('status', help='count shards by state')
+    status.add_argument('directory')
+    merge = commands.add_parser('merge', help='merge shard outputs')
+    merge.add_argument('directory')
+    merge.add_argument('output_path')
+    args = parser.parse_args(arguments)
+
+    if args.command == 'worker':
+        print('Processed %d shards' %
+              run_worker(args.directory, args.worker_id))
+    elif args.command == 'requeue':
+        print('Requeued %d shards' %
+              requeue_stale_shards(args.directory, args.timeout_seconds))
+    elif args.command == 'status':
+        status = get_sweep_status(args.directory)
+        print(', '.join('%s: %d' % (state, status[state])
+                        for state in QUEUE_STATES))
+    else:
+        merged = merge_outputs(args.directory, args.output_path)
+        n_scenarios = len(next(iter(merged.values()))) if merged else 0
+        print('Merged %d scenarios into %s' % (n_scenarios, args.output_path))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])